@@ -1,13 +1,25 @@
 import streamlit as st
 import pandas as pd
-import json
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import msgspec
 import os
 from google import genai
 from google.genai import types
 from dotenv import load_dotenv
-from PIL import Image
+from PIL import Image, ImageOps
 import io
 import traceback
+import hashlib
+import copy
+from collections import OrderedDict
+from typing import Optional
+import random
+import asyncio
+import threading
+from concurrent.futures import as_completed
+from google.genai import errors
 
 # --- SETUP ---
 load_dotenv()
@@ -16,33 +28,102 @@ if not GOOGLE_API_KEY:
     st.error("CRITICAL ERROR: GOOGLE_API_KEY not found in environment variables.")
     st.stop()
 
-# Initialize the GenAI client
-client = genai.Client(api_key=GOOGLE_API_KEY)
+# --- CONCURRENCY ---
+REQUEST_TIMEOUT_MS = 60_000  # large challans can stream for tens of seconds
+MAX_CONCURRENT_REQUESTS = 8  # bounded to stay within Gemini rate limits
+MAX_RETRIES = 4
+RETRY_BASE_DELAY = 1.0  # seconds, doubled on every retry
+STICKER_BATCH_SIZE = 4  # stickers packed into a single Gemini request
+
+# --- MODELS ---
+CHALLAN_MODEL = "gemini-2.5-flash"  # multi-line table extraction needs the full model
+STICKER_MODEL = "gemini-2.5-flash-lite"  # four short fields per sticker
+STICKER_MAX_OUTPUT_TOKENS = 128  # per sticker, bounds tail latency
+
+# --- IMAGE UPLOAD ---
+MAX_IMAGE_EDGE = 1536  # px, longest edge sent to Gemini
+JPEG_QUALITY = 85
+THUMBNAIL_EDGE = 400  # px, longest edge of the on-page previews
+
+# --- RESULT CACHE ---
+AI_CACHE_SIZE = 256  # most recent AI results kept per session
 
 # --- SCHEMAS ---
-CHALLAN_JSON_SCHEMA = """
-{
-"challan_number": "string | null",
-"date": "YYYY-MM-DD | null",
-"lines": [
-    {
-    "sto_sku": "string | null",
-    "material_description": "string",
-    "hsn": "string | null",
-    "size": "string",
-    "qty_units_expected": "integer"
-    }
-]
-}
+CHALLAN_SCHEMA = types.Schema(
+    type=types.Type.OBJECT,
+    properties={
+        "challan_number": types.Schema(type=types.Type.STRING, nullable=True),
+        "date": types.Schema(type=types.Type.STRING, nullable=True, description="YYYY-MM-DD"),
+        "lines": types.Schema(
+            type=types.Type.ARRAY,
+            items=types.Schema(
+                type=types.Type.OBJECT,
+                properties={
+                    "sto_sku": types.Schema(type=types.Type.STRING, nullable=True),
+                    "material_description": types.Schema(type=types.Type.STRING),
+                    "hsn": types.Schema(type=types.Type.STRING, nullable=True),
+                    "size": types.Schema(type=types.Type.STRING),
+                    "qty_units_expected": types.Schema(type=types.Type.INTEGER),
+                },
+                required=["sto_sku", "material_description", "hsn", "size", "qty_units_expected"],
+                property_ordering=["sto_sku", "material_description", "hsn", "size", "qty_units_expected"],
+            ),
+        ),
+    },
+    required=["challan_number", "date", "lines"],
+    property_ordering=["challan_number", "date", "lines"],
+)
+
+STICKER_SCHEMA = types.Schema(
+    type=types.Type.OBJECT,
+    properties={
+        "style": types.Schema(type=types.Type.STRING),
+        "code_size": types.Schema(type=types.Type.STRING),
+        "mrp": types.Schema(type=types.Type.NUMBER, nullable=True),
+        "net_qty": types.Schema(type=types.Type.INTEGER, nullable=True),
+    },
+    required=["style", "code_size", "mrp", "net_qty"],
+    property_ordering=["style", "code_size", "mrp", "net_qty"],
+)
+
+STICKER_BATCH_SCHEMA = types.Schema(type=types.Type.ARRAY, items=STICKER_SCHEMA)
+
+# Typed mirrors of the schemas above; responses are decoded and validated against them in one pass
+class ChallanLine(msgspec.Struct):
+    sto_sku: Optional[str]
+    material_description: str
+    hsn: Optional[str]
+    size: str
+    qty_units_expected: int
+
+class Challan(msgspec.Struct):
+    challan_number: Optional[str]
+    date: Optional[str]
+    lines: list[ChallanLine]
+
+class Sticker(msgspec.Struct):
+    style: str
+    code_size: str
+    mrp: Optional[float]
+    net_qty: Optional[int]
+
+# --- PROMPTS ---
+# Built once at import rather than on every Gemini call
+CHALLAN_PROMPT = """
+Analyze the provided delivery challan image and extract the key information.
+
+Key Instructions:
+- For CHALLANS, the 'sto_sku' is the numeric code in the 'STO' column. The 'material_description' is the text in the 'Material Description' column. You MUST extract them as separate fields. Do not merge them.
+- For CHALLANS with a grid of sizes, create a separate line item in the JSON for each size and its quantity. So basically the Size of the product should be taken from here
+- The quantity from the challan is always the quantity of the boxes (not the individual units inside them)
 """
 
-STICKER_JSON_SCHEMA = """
-{
-"style": "string",
-"code_size": "string",
-"mrp": "number | null",
-"net_qty": "integer | null"
-}
+STICKER_BATCH_PROMPT = """
+Analyze the provided product sticker images, each one preceded by its label (Sticker 1, Sticker 2, ...).
+Extract the key information from every sticker and return exactly one object per sticker, in the same order as the stickers.
+
+Key Instructions:
+- 'code_size' should be the most prominent size indicator and would be mentioned in the with "Code:" (e.g., 'S', '36B').
 """
 
 # --- STREAMLIT CONFIG ---
@@ -57,121 +138,298 @@ if 'challan_data' not in st.session_state:
     st.session_state.challan_data = {}
 if 'scanned_stickers' not in st.session_state:
     st.session_state.scanned_stickers = []
+if 'ai_cache' not in st.session_state:
+    st.session_state.ai_cache = OrderedDict()
+if 'thumbnails' not in st.session_state:
+    st.session_state.thumbnails = {}
+# Display frames are rebuilt only when the records change, not on every rerun
+if 'challan_lines_df' not in st.session_state:
+    st.session_state.challan_lines_df = pd.DataFrame()
+if 'stickers_log_df' not in st.session_state:
+    st.session_state.stickers_log_df = pd.DataFrame()
 
 # --- CORE FUNCTIONS ---
-def process_image_with_ai(image_file, document_type):
-    """Process image using Google Gemini AI"""
+@st.cache_resource
+def get_event_loop():
+    """Run one long-lived event loop in a daemon thread, shared by every session and rerun"""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="genai-event-loop", daemon=True).start()
+    return loop
+
+def run_on_event_loop(coro):
+    """Schedule a coroutine on the shared event loop and return its concurrent future"""
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop())
+
+@st.cache_resource(show_spinner=False)
+def get_client():
+    """Create the GenAI client once per server process.
+
+    google-genai keeps one aiohttp session per event loop, so its connections are
+    only reused because every call runs on the loop from get_event_loop().
+    """
+    return genai.Client(
+        api_key=GOOGLE_API_KEY,
+        http_options=types.HttpOptions(timeout=REQUEST_TIMEOUT_MS)
+    )
+
+async def stream_text_with_retry(**kwargs):
+    """Stream a Gemini response and return its full text, backing off exponentially when rate limited (HTTP 429)"""
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            chunks = await get_client().aio.models.generate_content_stream(**kwargs)
+            return "".join([chunk.text or "" async for chunk in chunks])
+        except errors.ClientError as e:
+            if e.code != 429 or attempt == MAX_RETRIES:
+                raise
+            await asyncio.sleep(RETRY_BASE_DELAY * 2 ** attempt + random.uniform(0, RETRY_BASE_DELAY))
+
+def content_key(image_file, document_type):
+    """Hash the image bytes and document type into an AI result cache key"""
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(image_file.getvalue())
+    hasher.update(document_type.encode())
+    return hasher.hexdigest()
+
+def cache_get(key):
+    """Return a copy of a cached AI result, or None if it was never processed"""
+    cache = st.session_state.ai_cache
+    if key not in cache:
+        return None
+    cache.move_to_end(key)
+    return copy.deepcopy(cache[key])
+
+def cache_put(key, result):
+    """Store an AI result, evicting the least recently used entries"""
+    cache = st.session_state.ai_cache
+    cache[key] = copy.deepcopy(result)
+    cache.move_to_end(key)
+    while len(cache) > AI_CACHE_SIZE:
+        cache.popitem(last=False)
+
+def flatten_to_rgb(img):
+    """Convert an image to 8-bit RGB for JPEG, compositing any transparency onto white"""
+    if img.mode in ('I', 'I;16', 'I;16B', 'I;16L'):
+        # 16-bit grayscale: scale down to 8-bit instead of clipping to black and white
+        img = img.convert('I').point(lambda v: v * (1 / 256)).convert('L')
+    
+    if img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info):
+        img = img.convert('RGBA')
+        canvas = Image.new('RGB', img.size, (255, 255, 255))
+        canvas.paste(img, mask=img.getchannel('A'))
+        return canvas
+    
+    return img.convert('RGB')
+
+def image_to_part(image_file):
+    """Convert an uploaded image file into a downscaled JPEG Gemini content part"""
+    image_bytes = image_file.getvalue()
+    img = Image.open(io.BytesIO(image_bytes))
+    
+    # Small JPEGs are sent untouched; anything else is resized and re-encoded
+    if img.format != 'JPEG' or max(img.size) > MAX_IMAGE_EDGE:
+        img = flatten_to_rgb(ImageOps.exif_transpose(img))
+        img.thumbnail((MAX_IMAGE_EDGE, MAX_IMAGE_EDGE), Image.LANCZOS)
+        buf = io.BytesIO()
+        img.save(buf, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+        image_bytes = buf.getvalue()
+    
+    return types.Part.from_bytes(
+        data=image_bytes,
+        mime_type='image/jpeg'
+    )
+
+def display_thumbnail(image_file):
+    """Return a small JPEG preview of an upload, decoding each distinct image only once"""
+    key = content_key(image_file, "THUMBNAIL")
+    if key not in st.session_state.thumbnails:
+        img = flatten_to_rgb(ImageOps.exif_transpose(Image.open(io.BytesIO(image_file.getvalue()))))
+        img.thumbnail((THUMBNAIL_EDGE, THUMBNAIL_EDGE))
+        buf = io.BytesIO()
+        img.save(buf, 'JPEG', quality=JPEG_QUALITY)
+        st.session_state.thumbnails[key] = buf.getvalue()
+    return st.session_state.thumbnails[key]
+
+async def process_challan_with_ai(image_file):
+    """Extract a delivery challan from its image using Google Gemini AI"""
+    raw_text = ""
     try:
-        schema = CHALLAN_JSON_SCHEMA if document_type == "CHALLAN" else STICKER_JSON_SCHEMA
-        
-        text_prompt = f"""
-        Analyze the provided image of a '{document_type}'.
-        Your task is to extract the key information and return ONLY a single, strictly valid JSON object that conforms precisely to the schema below.
-        Do not add any explanatory text, comments, or markdown formatting like ```json. Your entire response must be the JSON object itself.
-
-        Key Instructions:
-        - For CHALLANS, the 'sto_sku' is the numeric code in the 'STO' column. The 'material_description' is the text in the 'Material Description' column. You MUST extract them as separate fields. Do not merge them.
-        - For CHALLANS with a grid of sizes, create a separate line item in the JSON for each size and its quantity. So basically the Size of the product should be taken from here
-        - For STICKERS, 'code_size' should be the most prominent size indicator and would be mentioned in the with "Code:" (e.g., 'S', '36B').
-        - The quantity from the challan is always the quantity of the boxes (not the individual units inside them)
-
-        Schema to follow:
-        {schema}
-        """
-
-        # Convert uploaded file to bytes
-        image_bytes = image_file.getvalue()
-        
-        # Create image part using the new API
-        image_part = types.Part.from_bytes(
-            data=image_bytes,
-            mime_type=image_file.type or 'image/jpeg'
-        )
+        image_part = await asyncio.to_thread(image_to_part, image_file)
 
-        # Use the new client with thinking disabled
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=[text_prompt, image_part],
+        # Structured output guarantees JSON matching the schema; thinking is disabled
+        raw_text = await stream_text_with_retry(
+            model=CHALLAN_MODEL,
+            contents=[CHALLAN_PROMPT, image_part],
             config=types.GenerateContentConfig(
-                thinking_config=types.ThinkingConfig(thinking_budget=0)
+                thinking_config=types.ThinkingConfig(thinking_budget=0),
+                response_mime_type="application/json",
+                response_schema=CHALLAN_SCHEMA
             )
         )
         
-        raw_text = response.text.strip().replace("```json", "").replace("```", "").strip()
-        json_data = json.loads(raw_text)
+        json_data = msgspec.to_builtins(msgspec.json.decode(raw_text, type=Challan))
         
         return json_data, None
         
-    except json.JSONDecodeError as e:
-        return None, f"Failed to decode JSON from AI model. Raw response: {raw_text}"
+    except msgspec.DecodeError as e:
+        return None, f"Failed to decode JSON from AI model ({e}). Raw response: {raw_text}"
+    except Exception as e:
+        return None, f"An error occurred: {str(e)}"
+
+async def process_stickers_batch(image_files):
+    """Process several stickers with a single Gemini request, preserving order"""
+    raw_text = ""
+    try:
+        # Image decoding is CPU-bound, so keep it off the event loop
+        image_parts = await asyncio.gather(
+            *(asyncio.to_thread(image_to_part, image_file) for image_file in image_files)
+        )
+        contents = [STICKER_BATCH_PROMPT, f"There are {len(image_files)} stickers."]
+        for idx, image_part in enumerate(image_parts):
+            contents += [f"Sticker {idx+1}:", image_part]
+
+        raw_text = await stream_text_with_retry(
+            model=STICKER_MODEL,
+            contents=contents,
+            config=types.GenerateContentConfig(
+                thinking_config=types.ThinkingConfig(thinking_budget=0),
+                max_output_tokens=STICKER_MAX_OUTPUT_TOKENS * len(image_files),
+                response_mime_type="application/json",
+                response_schema=STICKER_BATCH_SCHEMA
+            )
+        )
+
+        stickers = msgspec.json.decode(raw_text, type=list[Sticker])
+
+        if len(stickers) != len(image_files):
+            return None, f"Expected {len(image_files)} stickers from AI model. Raw response: {raw_text}"
+
+        return msgspec.to_builtins(stickers), None
+
+    except msgspec.DecodeError as e:
+        return None, f"Failed to decode JSON from AI model ({e}). Raw response: {raw_text}"
     except Exception as e:
         return None, f"An error occurred: {str(e)}"
 
+def process_sticker_batches(batches, on_batch_done):
+    """Process sticker batches concurrently on the shared event loop, reporting each batch on the calling thread as it completes"""
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+    async def process(batch):
+        async with semaphore:
+            return await process_stickers_batch([sticker_file for sticker_file, _ in batch])
+
+    futures = {run_on_event_loop(process(batch)): batch for batch in batches}
+    for future in as_completed(futures):
+        results, error = future.result()
+        on_batch_done(futures[future], results, error)
+
 def clear_session():
     """Clear all session data"""
     st.session_state.challan_data = {}
     st.session_state.scanned_stickers = []
+    st.session_state.thumbnails = {}
+    st.session_state.ai_cache = OrderedDict()
+    st.session_state.challan_lines_df = pd.DataFrame()
+    st.session_state.stickers_log_df = pd.DataFrame()
     st.success("Session cleared! Please upload a new challan.")
 
+def normalize_challan(challan):
+    """Precompute the normalized reconciliation keys of every challan line"""
+    for line in challan['lines']:
+        line['_key_desc'] = line['material_description'].strip()
+        line['_key_size'] = line['size'].strip().upper()
+    return challan
+
+def normalize_sticker(sticker):
+    """Precompute the normalized reconciliation keys of a scanned sticker"""
+    sticker['_style_norm'] = sticker['style'].strip()
+    sticker['_size_norm'] = sticker['code_size'].strip().upper()
+    return sticker
+
+def visible_columns(df):
+    """Drop internal underscore-prefixed columns before display"""
+    return df[[col for col in df.columns if not str(col).startswith('_')]]
+
+def records_to_df(records):
+    """Build a display DataFrame from records, hiding internal columns"""
+    return visible_columns(pd.DataFrame(records))
+
+def report_to_csv(report_df):
+    """Serialize a report DataFrame to CSV bytes with Arrow's native CSV writer"""
+    buf = io.BytesIO()
+    pacsv.write_csv(pa.Table.from_pandas(report_df, preserve_index=False), buf)
+    return buf.getvalue()
+
 def run_reconciliation():
     """Run reconciliation between challan and scanned stickers"""
     if not st.session_state.challan_data or 'lines' not in st.session_state.challan_data:
         st.warning("No challan data to reconcile. Please upload a challan first.")
         return None
     
-    expected_items = {}
-    for line in st.session_state.challan_data.get('lines', []):
-        key = (
-            str(line.get('material_description', '')).strip(),
-            str(line.get('size', '')).strip().upper()
-        )
-        if key not in expected_items:
-            expected_items[key] = {'expected': 0, 'received': 0}
-        expected_items[key]['expected'] += line.get('qty_units_expected', 0)
+    # Keys were normalized once at challan ingest, see normalize_challan
+    lines_df = pd.DataFrame(
+        st.session_state.challan_data['lines'],
+        columns=['_key_desc', '_key_size', 'qty_units_expected']
+    ).rename(columns={'_key_desc': 'key_desc', '_key_size': 'key_size'})
     
-    unmatched_stickers = []
-
-    for sticker in st.session_state.scanned_stickers:
-        sticker_style = str(sticker.get('style', '')).strip()
-        sticker_size = str(sticker.get('code_size', '')).strip().upper()
-        
-        match_found = False
-        for challan_key in expected_items.keys():
-            challan_desc = challan_key[0]
-            challan_size = challan_key[1]
-            
-            if challan_desc.startswith(sticker_style) and challan_size == sticker_size:
-                expected_items[challan_key]['received'] += 1
-                match_found = True
-                break
-        
-        if not match_found:
-            unmatched_stickers.append(sticker)
-
-    report_data = []
-    for key, data in expected_items.items():
-        variance = data['received'] - data['expected']
-        status = "✅ MATCH" if variance == 0 else ("⚠️ SHORT" if variance < 0 else "❗️ OVER")
-        report_data.append({
-            "Challan Description": key[0],
-            "Size": key[1],
-            "Expected": data['expected'],
-            "Received": data['received'],
-            "Variance": variance,
-            "Status": status
-        })
+    # Give each distinct (description, size) key a flat array index, in challan order
+    key_to_idx = {}
+    line_idxs = np.array(
+        [key_to_idx.setdefault(key, len(key_to_idx)) for key in zip(lines_df['key_desc'], lines_df['key_size'])],
+        dtype=np.intp
+    )
+    expected = np.zeros(len(key_to_idx), dtype=np.int64)
+    received = np.zeros(len(key_to_idx), dtype=np.int64)
+    np.add.at(expected, line_idxs, lines_df['qty_units_expected'].to_numpy(dtype=np.int64))
+    
+    # Sticker keys were normalized once when scanned, see normalize_sticker
+    stickers_df = pd.DataFrame(
+        st.session_state.scanned_stickers,
+        columns=['style', 'code_size', '_style_norm', '_size_norm']
+    ).rename(columns={'_style_norm': 'key_style', '_size_norm': 'key_size'})
+    
+    # Match each distinct (style, size) pair once, one size at a time: a broadcast
+    # startswith gives a (pairs x lines) hit matrix and argmax picks the first line hit
+    ch_desc = np.array([desc for desc, _ in key_to_idx], dtype=str)
+    ch_size = np.array([size for _, size in key_to_idx], dtype=str)
+    
+    pairs = stickers_df[['key_style', 'key_size']].drop_duplicates()
+    st_style = pairs['key_style'].to_numpy(dtype=str)
+    st_size = pairs['key_size'].to_numpy(dtype=str)
+    pair_idxs = np.full(len(pairs), -1, dtype=np.intp)
+    
+    for size in np.intersect1d(st_size, ch_size):
+        rows = np.flatnonzero(st_size == size)
+        cols = np.flatnonzero(ch_size == size)
+        hits = np.char.startswith(ch_desc[cols][None, :], st_style[rows][:, None])
+        pair_idxs[rows] = np.where(hits.any(axis=1), cols[hits.argmax(axis=1)], -1)
+    
+    pairs['key_idx'] = pair_idxs
+    stickers_df = stickers_df.merge(pairs, on=['key_style', 'key_size'], how='left')
+    matched = stickers_df['key_idx'].to_numpy() >= 0
+    np.add.at(received, stickers_df['key_idx'].to_numpy()[matched], 1)
     
-    for sticker in unmatched_stickers:
-        report_data.append({
-            "Challan Description": f"(UNMATCHED SCAN) {sticker.get('style','')}",
-            "Size": sticker.get('code_size',''),
-            "Expected": 0,
-            "Received": 1,
-            "Variance": 1,
-            "Status": "❗️ OVER"
-        })
-
-    return pd.DataFrame(report_data)
+    variance = received - expected
+    report_df = pd.DataFrame({
+        "Challan Description": [desc for desc, _ in key_to_idx],
+        "Size": [size for _, size in key_to_idx],
+        "Expected": expected,
+        "Received": received,
+        "Variance": variance,
+        "Status": np.select([variance == 0, variance < 0], ["✅ MATCH", "⚠️ SHORT"], default="❗️ OVER")
+    })
+    
+    unmatched = stickers_df[~matched]
+    unmatched_df = pd.DataFrame({
+        "Challan Description": "(UNMATCHED SCAN) " + unmatched['style'],
+        "Size": unmatched['code_size'],
+        "Expected": 0,
+        "Received": 1,
+        "Variance": 1,
+        "Status": "❗️ OVER"
+    })
+
+    return pd.concat([report_df, unmatched_df], ignore_index=True)
 
 # --- MAIN UI ---
 st.title("🚚 Warehouse Inbound Reconciliation POC")
@@ -181,14 +439,6 @@ with st.sidebar:
     st.header("Session Management")
     if st.button("🔄 Clear Session / Start New", type="secondary"):
         clear_session()
-    
-    st.header("Current Status")
-    if st.session_state.challan_data:
-        st.success(f"✅ Challan loaded: {st.session_state.challan_data.get('challan_number', 'N/A')}")
-    else:
-        st.info("📋 No challan loaded")
-    
-    st.info(f"📦 Stickers scanned: {len(st.session_state.scanned_stickers)}")
 
 # Main tabs
 tab1, tab2 = st.tabs(["📥 Inbound Processing", "📊 Reconciliation Dashboard"])
@@ -206,17 +456,22 @@ with tab1:
         col1, col2 = st.columns([1, 2])
         
         with col1:
-            st.image(challan_file, caption="Uploaded Challan", use_column_width=True)
+            st.image(display_thumbnail(challan_file), caption="Uploaded Challan", use_column_width=True)
         
         with col2:
             if st.button("🔍 Process Challan", type="primary"):
                 with st.spinner("Processing challan with AI..."):
-                    result, error = process_image_with_ai(challan_file, "CHALLAN")
+                    key = content_key(challan_file, "CHALLAN")
+                    result, error = cache_get(key), None
+                    if result is None:
+                        result, error = run_on_event_loop(process_challan_with_ai(challan_file)).result()
                     
                     if error:
                         st.error(f"Error processing challan: {error}")
                     else:
-                        st.session_state.challan_data = result
+                        cache_put(key, result)
+                        st.session_state.challan_data = normalize_challan(result)
+                        st.session_state.challan_lines_df = records_to_df(result['lines'])
                         st.success("Challan processed successfully!")
                         st.rerun()
     
@@ -232,8 +487,7 @@ with tab1:
         
         if 'lines' in st.session_state.challan_data:
             st.subheader("📦 Challan Line Items")
-            df = pd.DataFrame(st.session_state.challan_data['lines'])
-            st.dataframe(df, use_container_width=True)
+            st.dataframe(st.session_state.challan_lines_df, use_container_width=True)
     
     st.divider()
     
@@ -255,32 +509,54 @@ with tab1:
             
             for idx, sticker_file in enumerate(sticker_files):
                 with cols[idx % 4]:
-                    st.image(sticker_file, caption=f"Sticker {idx+1}", use_column_width=True)
+                    st.image(display_thumbnail(sticker_file), caption=f"Sticker {idx+1}", use_column_width=True)
             
             if st.button("🔍 Process All Stickers", type="primary"):
-                progress_bar = st.progress(0)
-                status_text = st.empty()
-                
-                for idx, sticker_file in enumerate(sticker_files):
-                    status_text.text(f"Processing sticker {idx+1}/{len(sticker_files)}...")
-                    progress_bar.progress((idx + 1) / len(sticker_files))
+                # Updated in place, so the new stickers show up below without a full script rerun
+                with st.status(f"Processing {len(sticker_files)} stickers...", expanded=True) as status:
+                    # Reuse results for stickers already processed this session
+                    completed, pending, failed = [], [], []
+                    for sticker_file in sticker_files:
+                        key = content_key(sticker_file, "STICKER")
+                        cached = cache_get(key)
+                        if cached is not None:
+                            st.session_state.scanned_stickers.append(normalize_sticker(cached))
+                            completed.append(sticker_file)
+                        else:
+                            pending.append((sticker_file, key))
                     
-                    result, error = process_image_with_ai(sticker_file, "STICKER")
+                    # Pack stickers into batches and send the batches concurrently,
+                    # since Gemini calls are network-bound
+                    batches = [
+                        pending[i:i + STICKER_BATCH_SIZE]
+                        for i in range(0, len(pending), STICKER_BATCH_SIZE)
+                    ]
                     
-                    if error:
-                        st.error(f"Error processing {sticker_file.name}: {error}")
+                    def on_batch_done(batch, results, error):
+                        completed.extend(sticker_file for sticker_file, _ in batch)
+                        status.update(label=f"Processed sticker {len(completed)}/{len(sticker_files)}...")
+                        
+                        if error:
+                            names = ", ".join(sticker_file.name for sticker_file, _ in batch)
+                            st.error(f"Error processing {names}: {error}")
+                            failed.extend(batch)
+                        else:
+                            for (_, key), result in zip(batch, results):
+                                cache_put(key, result)
+                            st.session_state.scanned_stickers.extend(normalize_sticker(result) for result in results)
+                    
+                    process_sticker_batches(batches, on_batch_done)
+                    st.session_state.stickers_log_df = records_to_df(st.session_state.scanned_stickers)
+                    
+                    if failed:
+                        status.update(label=f"Processed {len(sticker_files) - len(failed)} of {len(sticker_files)} stickers", state="error")
                     else:
-                        st.session_state.scanned_stickers.append(result)
-                
-                status_text.text("All stickers processed!")
-                st.success(f"Successfully processed {len(sticker_files)} stickers!")
-                st.rerun()
+                        status.update(label=f"Successfully processed {len(sticker_files)} stickers!", state="complete", expanded=False)
     
     # Display scanned stickers
     if st.session_state.scanned_stickers:
         st.subheader("📦 Scanned Stickers Log")
-        stickers_df = pd.DataFrame(st.session_state.scanned_stickers)
-        st.dataframe(stickers_df, use_container_width=True)
+        st.dataframe(st.session_state.stickers_log_df, use_container_width=True)
 
 with tab2:
     st.header("📊 Reconciliation Dashboard")
@@ -293,7 +569,7 @@ with tab2:
         col1, col2, col3 = st.columns(3)
         
         with col1:
-            st.metric("Expected Items", len(st.session_state.challan_data.get('lines', [])))
+            st.metric("Expected Items", len(st.session_state.challan_data['lines']))
         with col2:
             st.metric("Scanned Stickers", len(st.session_state.scanned_stickers))
         with col3:
@@ -339,7 +615,7 @@ with tab2:
             )
             
             # Download report
-            csv = report_df.to_csv(index=False)
+            csv = report_to_csv(report_df)
             st.download_button(
                 label="📥 Download Report as CSV",
                 data=csv,
@@ -347,6 +623,16 @@ with tab2:
                 mime="text/csv"
             )
 
+# Sidebar status is rendered last so it reflects work done earlier in this run
+with st.sidebar:
+    st.header("Current Status")
+    if st.session_state.challan_data:
+        st.success(f"✅ Challan loaded: {st.session_state.challan_data.get('challan_number', 'N/A')}")
+    else:
+        st.info("📋 No challan loaded")
+    
+    st.info(f"📦 Stickers scanned: {len(st.session_state.scanned_stickers)}")
+
 # Footer
 st.divider()
 st.markdown("*Warehouse Reconciliation POC - avencer.tech*")
\ No newline at end of file